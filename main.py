@@ -2,9 +2,31 @@ import streamlit as st
 import asyncio
 import edge_tts
 import tempfile
+import io
 import os
+import shutil
 from pydub import AudioSegment
 import json
+import re
+import threading
+import numpy as np
+import av
+from scipy.signal import resample_poly
+
+try:
+    import uvloop  # not available on Windows
+except ImportError:
+    uvloop = None
+
+try:
+    import soxr  # faster resampler; scipy's resample_poly is the fallback
+except ImportError:
+    soxr = None
+
+try:
+    from numba import njit  # fused mix kernel; NumPy is the fallback
+except ImportError:
+    njit = None
 
 # 🎙️ Voice options
 VOICES = {
@@ -30,9 +52,11 @@ def save_presets(voice, rate, pitch):
     try:
         with open(PRESET_FILE, "w") as f:
             json.dump({"voice": voice, "rate": rate, "pitch": pitch}, f)
+        load_presets.clear()
     except Exception as e:
         st.error(f"Error saving presets: {e}")
 
+@st.cache_data(show_spinner=False)
 def load_presets():
     try:
         if os.path.exists(PRESET_FILE):
@@ -42,73 +66,241 @@ def load_presets():
         st.warning(f"Could not load presets: {e}")
     return {"voice": list(VOICES.keys())[0], "rate": 100, "pitch": 0}
 
+# ✂️ Split text into sentences for parallel synthesis
+def split_sentences(text):
+    sentences = []
+    for s in re.split(r'(?<=[.!?])\s+', text):
+        s = s.strip()
+        if not s:
+            continue
+        # edge-tts returns no audio for punctuation-only chunks like "...", so fold them into the previous sentence
+        if not re.search(r'\w', s):
+            if sentences:
+                sentences[-1] = f"{sentences[-1]} {s}"
+            continue
+        sentences.append(s)
+    return sentences
+
 # 🔊 Generate TTS audio
-async def generate_tts(text, voice, filename, rate, pitch):
-    ssml_text = f"""{text}"""
-    communicate = edge_tts.Communicate(ssml_text, voice)
-    communicate._ssml = True
-    await communicate.save(filename)
+TTS_CONCURRENCY = 4
+
+async def synth_sentence(sentence, voice, semaphore):
+    async with semaphore:
+        ssml_text = f"""{sentence}"""
+        communicate = edge_tts.Communicate(ssml_text, voice)
+        communicate._ssml = True
+        bio = io.BytesIO()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                bio.write(chunk["data"])
+        return bio.getvalue()
+
+# 🔁 One long-lived event loop for edge-tts (Streamlit reruns the script, so cache it)
+@st.cache_resource(show_spinner=False)
+def get_tts_loop():
+    loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def run_async(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_tts_loop()).result()
+
+async def new_tts_semaphore():
+    return asyncio.Semaphore(TTS_CONCURRENCY)
+
+# 🌊 Yield each sentence's MP3 in order (all are synthesized concurrently)
+def iter_tts_parts(text, voice, rate, pitch):
+    sentences = split_sentences(text) or [text]
+    # Create the semaphore on the TTS loop; older Pythons bind it to the current loop at init
+    semaphore = run_async(new_tts_semaphore())
+    futures = [
+        asyncio.run_coroutine_threadsafe(synth_sentence(s, voice, semaphore), get_tts_loop())
+        for s in sentences
+    ]
+    for future in futures:
+        yield future.result()
+
+def generate_tts(text, voice, rate, pitch):
+    # MP3 frames concatenate cleanly, so join the raw bytes in order
+    return b"".join(iter_tts_parts(text, voice, rate, pitch))
+
+# 💾 Cache synthesized speech on its inputs so Preview → Download reuses it
+TTS_CACHE_ENTRIES = 8
+
+@st.cache_data(show_spinner=False, max_entries=TTS_CACHE_ENTRIES)
+def synth_tts_bytes(text, voice, rate, pitch):
+    return generate_tts(text, voice, rate, pitch)
+
+# 🎵 Decode uploaded music once per upload (keyed by Streamlit's upload id, not the bytes)
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_music_segment(music_key, _uploaded_music, ext):
+    music_format = ext.lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{music_format}") as tmp_music:
+        # Stream the upload to disk in 1 MB chunks instead of copying it via getvalue()
+        _uploaded_music.seek(0)
+        shutil.copyfileobj(_uploaded_music, tmp_music, length=1 << 20)
+        music_path = tmp_music.name
+    try:
+        fmt = {'mp3': 'mp3', 'wav': 'wav', 'wave': 'wav'}.get(music_format, music_format)
+        return AudioSegment.from_file(music_path, format=fmt)
+    finally:
+        os.remove(music_path)
+
+def load_uploaded_music(uploaded_music):
+    music_key = uploaded_music.file_id
+    music_ext = uploaded_music.name.split('.')[-1]
+    return music_key, load_music_segment(music_key, uploaded_music, music_ext)
+
+# 🎚️ Resample, loop, gain and fade the music once per upload/settings combination
+@st.cache_resource(show_spinner=False, max_entries=4)
+def prepare_music(music_key, _music, frame_rate, channels, music_volume_pct, n_frames, fade_in, fade_out):
+    music = _music
+    if music.sample_width != 2:
+        music = music.set_sample_width(2)
+
+    music_arr = np.frombuffer(music.raw_data, dtype=np.int16).reshape(-1, music.channels)
+
+    if frame_rate != music.frame_rate:
+        if soxr:
+            music_arr = soxr.resample(music_arr, music.frame_rate, frame_rate, quality="HQ")
+        else:
+            music_arr = resample_poly(music_arr, frame_rate, music.frame_rate, axis=0)
+            music_arr = np.clip(music_arr, -32768, 32767).astype(np.int16)
+    if channels != music.channels:
+        if music.channels == 1:
+            music_arr = np.repeat(music_arr, channels, axis=1)
+        else:
+            music_arr = music_arr.mean(axis=1, keepdims=True).astype(np.int16)
+            if channels > 1:
+                music_arr = np.repeat(music_arr, channels, axis=1)
+
+    # Loop music to the voice length
+    if music_arr.shape[0] < n_frames:
+        music_arr = np.tile(music_arr, ((n_frames // music_arr.shape[0]) + 1, 1))
+    music_arr = music_arr[:n_frames]
+
+    # Fixed-point Q15 gain
+    volume_db = -30 + (music_volume_pct * 0.35)
+    gain_q15 = int(10 ** (volume_db / 20) * 32768)
+    music_arr = (music_arr.astype(np.int32) * gain_q15) >> 15
+
+    # Apply fade effects (3s linear ramps, multiplied in place)
+    fade_len = min(int(3.0 * frame_rate), n_frames)
+    if (fade_in or fade_out) and fade_len:
+        ramp = np.linspace(0, 1, fade_len, dtype=np.float32)[:, None]
+        if fade_in:
+            head = music_arr[:fade_len]
+            np.multiply(head, ramp, out=head, casting="unsafe")
+        if fade_out:
+            tail = music_arr[-fade_len:]
+            np.multiply(tail, ramp[::-1], out=tail, casting="unsafe")
+
+    # Shared across reruns, so guard against in-place edits
+    music_arr.flags.writeable = False
+    return music_arr
+
+# 📦 Encode contiguous int16 PCM (frames x channels) to MP3 bytes in-process with PyAV
+MP3_FRAME_SIZE = 1152
+
+def export_mp3(pcm, frame_rate, bitrate=192_000):
+    layout = "mono" if pcm.shape[1] == 1 else "stereo"
+    pcm = np.ascontiguousarray(pcm)
+
+    bio = io.BytesIO()
+    with av.open(bio, mode="w", format="mp3") as container:
+        stream = container.add_stream("mp3", rate=frame_rate)
+        stream.layout = layout
+        stream.format = "s16p"
+        stream.bit_rate = bitrate
+
+        # Packed s16 rows are views into pcm; PyAV converts to planar per frame
+        for start in range(0, pcm.shape[0], MP3_FRAME_SIZE):
+            frame = av.AudioFrame.from_ndarray(
+                pcm[start:start + MP3_FRAME_SIZE].reshape(1, -1), format="s16", layout=layout
+            )
+            frame.sample_rate = frame_rate
+            frame.pts = start
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode(None))
+    return bio.getvalue()
+
+# ⚡ Add voice + prepared music, clip and downcast to int16 in a single pass
+if njit:
+    # Serial on purpose: Streamlit calls this from one thread per session, and
+    # parallel=True aborts under Numba's non-threadsafe workqueue layer
+    @njit(cache=True)
+    def mix_kernel(voice, music, out):
+        for i in range(voice.shape[0]):
+            for c in range(voice.shape[1]):
+                s = voice[i, c] + music[i, c]
+                if s > 32767:
+                    s = 32767
+                elif s < -32768:
+                    s = -32768
+                out[i, c] = s
+
+def mix_pcm(voice_arr, music_arr):
+    if njit:
+        # The kernel indexes music directly, so it cannot broadcast like NumPy
+        assert music_arr.shape == voice_arr.shape, (music_arr.shape, voice_arr.shape)
+        mixed_arr = np.empty(voice_arr.shape, dtype=np.int16)
+        mix_kernel(voice_arr, music_arr, mixed_arr)
+        return mixed_arr
+
+    # int16 + int32 promotes without an explicit upcast; clip in place
+    mixed_arr = voice_arr + music_arr
+    np.clip(mixed_arr, -32768, 32767, out=mixed_arr)
+    return mixed_arr.astype(np.int16)
 
 # 🎼 Mix background music and voice with optional fade effects
-def mix_with_music(voice_path, music_path, output_path, music_volume_pct, fade_in=False, fade_out=False):
+def mix_with_music(voice_bytes, music, music_key, music_volume_pct, fade_in=False, fade_out=False):
     try:
-        voice = AudioSegment.from_file(voice_path, format="mp3")
-        music_format = music_path.split('.')[-1].lower()
-        music = (
-            AudioSegment.from_mp3(music_path)
-            if music_format == 'mp3'
-            else AudioSegment.from_wav(music_path)
-            if music_format in ['wav', 'wave']
-            else AudioSegment.from_file(music_path)
-        )
-
-        if len(voice) == 0 or len(music) == 0:
-            st.error("❌ One of the audio files is empty or corrupted")
-            return False
-
+        # Nothing to mix: reuse the edge-tts MP3 as-is instead of re-encoding it
         if music_volume_pct == 0:
-            mixed = voice
-        else:
-            if voice.frame_rate != music.frame_rate:
-                music = music.set_frame_rate(voice.frame_rate)
-            if voice.channels != music.channels:
-                music = music.set_channels(voice.channels)
+            return voice_bytes
 
-            volume_db = -30 + (music_volume_pct * 0.35)
-            music = music + volume_db
+        voice = AudioSegment.from_file(io.BytesIO(voice_bytes), format="mp3")
 
-            if len(music) < len(voice):
-                music *= (len(voice) // len(music)) + 1
-            music = music[:len(voice)]
-
-            # Apply fade effects
-            if fade_in:
-                music = music.fade_in(3000)
-            if fade_out:
-                music = music.fade_out(3000)
+        if len(voice) == 0 or len(music) == 0:
+            st.error("❌ One of the audio files is empty or corrupted")
+            return None
+
+        if voice.sample_width != 2:
+            voice = voice.set_sample_width(2)
+
+        voice_arr = np.frombuffer(voice.raw_data, dtype=np.int16).reshape(-1, voice.channels)
+        music_arr = prepare_music(
+            music_key,
+            music,
+            voice.frame_rate,
+            voice.channels,
+            music_volume_pct,
+            voice_arr.shape[0],
+            fade_in,
+            fade_out,
+        )
 
-            mixed = voice.overlay(music)
+        mixed_arr = mix_pcm(voice_arr, music_arr)
 
-        mixed.export(output_path, format="mp3", bitrate="192k", parameters=["-q:a", "2"])
-        return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+        return export_mp3(mixed_arr, voice.frame_rate) or None
 
     except Exception as e:
         st.error(f"❌ Error mixing audio: {e}")
-        return False
+        return None
 
 # 🧪 Test audio files
-def test_audio_files(voice_path, music_path):
+def test_audio_files(voice_bytes, music):
     try:
-        voice = AudioSegment.from_file(voice_path)
-        music = AudioSegment.from_file(music_path)
+        voice = AudioSegment.from_file(io.BytesIO(voice_bytes), format="mp3")
         test_music = music + (-20)
         test_music = test_music[:min(len(voice), 5000)]
         test_voice = voice[:min(len(voice), 5000)]
         test_mixed = test_voice.overlay(test_music)
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as test_file:
-            test_mixed.export(test_file.name, format="mp3")
-            st.audio(test_file.name, format="audio/mp3")
+        # WAV needs no encode, and BytesIO avoids a disk write
+        bio = io.BytesIO()
+        test_mixed.export(bio, format="wav")
+        st.audio(bio.getvalue(), format="audio/wav")
 
         return True
     except Exception as e:
@@ -168,33 +360,26 @@ with col1:
         else:
             with st.spinner("Generating preview..."):
                 try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_voice:
-                        asyncio.run(generate_tts(text, voice_id, tmp_voice.name, rate, pitch))
-                        final_preview_path = tmp_voice.name
-
-                        if use_music and uploaded_music and music_volume_pct > 0:
-                            music_ext = uploaded_music.name.split('.')[-1]
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{music_ext}") as tmp_music:
-                                tmp_music.write(uploaded_music.getvalue())
-                                music_path = tmp_music.name
-
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_mixed:
-                                preview_output = tmp_mixed.name
-
-                            success = mix_with_music(
-                                tmp_voice.name,
-                                music_path,
-                                preview_output,
-                                music_volume_pct,
-                                fade_in=fade_in_enabled,
-                                fade_out=fade_out_enabled,
-                            )
-
-                            if success:
-                                final_preview_path = preview_output
-                                st.success("✅ Preview with music ready")
-
-                        st.audio(final_preview_path, format="audio/mp3")
+                    voice_bytes = synth_tts_bytes(text, voice_id, rate, pitch)
+                    final_preview = voice_bytes
+
+                    if use_music and uploaded_music and music_volume_pct > 0:
+                        music_key, music_seg = load_uploaded_music(uploaded_music)
+
+                        mixed = mix_with_music(
+                            voice_bytes,
+                            music_seg,
+                            music_key,
+                            music_volume_pct,
+                            fade_in=fade_in_enabled,
+                            fade_out=fade_out_enabled,
+                        )
+
+                        if mixed:
+                            final_preview = mixed
+                            st.success("✅ Preview with music ready")
+
+                    st.audio(final_preview, format="audio/mp3")
                 except Exception as e:
                     st.error(f"Error generating preview: {e}")
 
@@ -206,49 +391,45 @@ with col2:
         else:
             with st.spinner("Rendering final audio..."):
                 try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_voice:
-                        asyncio.run(generate_tts(text, voice_id, tmp_voice.name, rate, pitch))
-                        final_output = tmp_voice.name
-
-                        if use_music and uploaded_music and music_volume_pct > 0:
-                            st.info("🎵 Mixing with background music...")
-
-                            music_ext = uploaded_music.name.split('.')[-1]
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{music_ext}") as tmp_music:
-                                tmp_music.write(uploaded_music.getvalue())
-                                music_path = tmp_music.name
-
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_mixed:
-                                mixed_output = tmp_mixed.name
-
-                            if st.checkbox("🧪 Test audio files first"):
-                                test_audio_files(tmp_voice.name, music_path)
-
-                            success = mix_with_music(
-                                tmp_voice.name,
-                                music_path,
-                                mixed_output,
-                                music_volume_pct,
-                                fade_in=fade_in_enabled,
-                                fade_out=fade_out_enabled,
-                            )
-
-                            if success:
-                                final_output = mixed_output
-                                st.success("✅ Audio mixed and ready")
-
-                        # Generate filename from user input
-                        filename = f"{user_filename.strip() or 'output'}.mp3"
-                        with open(final_output, "rb") as f:
-                            st.download_button(
-                                label="📥 Download Final Audio",
-                                data=f.read(),
-                                file_name=filename,
-                                mime="audio/mpeg"
-                            )
+                    voice_bytes = synth_tts_bytes(text, voice_id, rate, pitch)
+                    final_output = voice_bytes
+
+                    if use_music and uploaded_music and music_volume_pct > 0:
+                        st.info("🎵 Mixing with background music...")
+
+                        music_key, music_seg = load_uploaded_music(uploaded_music)
+
+                        mixed = mix_with_music(
+                            voice_bytes,
+                            music_seg,
+                            music_key,
+                            music_volume_pct,
+                            fade_in=fade_in_enabled,
+                            fade_out=fade_out_enabled,
+                        )
+
+                        if mixed:
+                            final_output = mixed
+                            st.success("✅ Audio mixed and ready")
+
+                    # Generate filename from user input
+                    filename = f"{user_filename.strip() or 'output'}.mp3"
+                    st.download_button(
+                        label="📥 Download Final Audio",
+                        data=final_output,
+                        file_name=filename,
+                        mime="audio/mpeg"
+                    )
                 except Exception as e:
                     st.error(f"Error generating audio: {e}")
 
+# 🧪 Optional audio test (a nested widget under Download would reset on click)
+if use_music and uploaded_music and text.strip():
+    if st.button("🧪 Run audio test"):
+        with st.spinner("Testing audio files..."):
+            _, music_seg = load_uploaded_music(uploaded_music)
+            test_audio_files(synth_tts_bytes(text, voice_id, rate, pitch), music_seg)
+
 # 🛠️ Optional debug info
 if st.checkbox("🔧 Show Debug Info"):
     st.write("**Settings:**")
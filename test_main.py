@@ -0,0 +1,21 @@
+import pytest
+
+main = pytest.importorskip("main")
+
+
+def test_split_sentences_on_terminal_punctuation():
+    assert main.split_sentences("Hello there. How are you? Great!") == [
+        "Hello there.",
+        "How are you?",
+        "Great!",
+    ]
+
+
+def test_split_sentences_folds_punctuation_only_chunks():
+    assert main.split_sentences("Wait... what? ... Yes.") == ["Wait...", "what? ...", "Yes."]
+    assert main.split_sentences("... Hello.") == ["Hello."]
+
+
+def test_split_sentences_without_words_is_empty():
+    assert main.split_sentences("") == []
+    assert main.split_sentences("  ... !!! ") == []